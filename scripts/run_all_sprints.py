@@ -2,40 +2,36 @@
 Master script to run all sprints in sequence
 """
 
+import asyncio
 import sys
 import os
 import subprocess
 from datetime import datetime
 
-def run_sprint(script_name, sprint_number, description):
-    """Run a sprint script and handle errors"""
+def run_sprint(sprint_number, description, sprint_func, *args):
+    """Run a sprint function and handle errors.
+
+    Returns (success, result) so each sprint's output can be handed to
+    the next one in memory instead of round-tripping through disk.
+    """
     print(f"\n{'='*60}")
     print(f"RUNNING SPRINT {sprint_number}: {description}")
-    print(f"Script: {script_name}")
+    print(f"Function: {sprint_func.__name__}")
     print(f"Started at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print(f"{'='*60}")
-    
+
     try:
-        # Import and run the sprint module
-        if script_name == 'sprint1_data_acquisition.py':
-            from sprint1_data_acquisition import download_and_prepare_road_network
-            download_and_prepare_road_network()
-        elif script_name == 'sprint2_traffic_simulation.py':
-            from sprint2_traffic_simulation import generate_traffic_simulation
-            generate_traffic_simulation()
-        elif script_name == 'sprint3_route_optimization.py':
-            from sprint3_route_optimization import optimize_single_route
-            optimize_single_route()
-        elif script_name == 'sprint4_pooling_integration.py':
-            from sprint4_pooling_integration import pooling_and_integration
-            pooling_and_integration()
-        
+        result = sprint_func(*args)
+        if result is None:
+            print(f"\n✗ SPRINT {sprint_number} FAILED")
+            return False, None
+
         print(f"\n✓ SPRINT {sprint_number} COMPLETED SUCCESSFULLY!")
-        return True
-        
+        return True, result
+
     except Exception as e:
         print(f"\n✗ SPRINT {sprint_number} FAILED: {e}")
-        return False
+        return False, None
 
 def main():
     """Run all sprints in sequence"""
@@ -50,24 +46,61 @@ def main():
     
     # Create data directory
     os.makedirs('data', exist_ok=True)
-    
-    sprints = [
-        ('sprint1_data_acquisition.py', 1, 'Data Acquisition & Preparation'),
-        ('sprint2_traffic_simulation.py', 2, 'Traffic Simulation'),
-        ('sprint3_route_optimization.py', 3, 'Route Optimization'),
-        ('sprint4_pooling_integration.py', 4, 'Pooling & Integration')
-    ]
-    
+
+    from sprint1_data_acquisition import download_and_prepare_road_network
+    from sprint2_traffic_simulation import build_time_factor_table, generate_traffic_simulation
+    from sprint3_route_optimization import optimize_single_route
+    from sprint4_pooling_integration import pooling_and_integration
+
     results = []
     start_time = datetime.now()
-    
-    for script_name, sprint_number, description in sprints:
-        success = run_sprint(script_name, sprint_number, description)
-        results.append((sprint_number, description, success))
-        
-        if not success:
-            print(f"\n⚠ Sprint {sprint_number} failed. Stopping pipeline.")
-            break
+
+    # Sprint 1's network download and sprint 2's time/factor table have no
+    # data dependency on each other, so overlap them
+    async def run_sprint1_with_precompute():
+        download = asyncio.to_thread(run_sprint, 1, 'Data Acquisition & Preparation',
+                                     download_and_prepare_road_network)
+        precompute = asyncio.to_thread(build_time_factor_table)
+        return await asyncio.gather(download, precompute)
+
+    (success, roads_gdf), time_table = asyncio.run(run_sprint1_with_precompute())
+    results.append((1, 'Data Acquisition & Preparation', success))
+
+    if not success:
+        print(f"\n⚠ Sprint 1 failed. Stopping pipeline.")
+
+    # Each remaining sprint hands its result to the next in memory; the
+    # files the sprints write remain available for standalone runs.
+    if success:
+        avg_speeds = None
+        graph = None
+        sprints = [
+            (2, 'Traffic Simulation', generate_traffic_simulation),
+            (3, 'Route Optimization', optimize_single_route),
+            (4, 'Pooling & Integration', pooling_and_integration)
+        ]
+
+        for sprint_number, description, sprint_func in sprints:
+            if sprint_number == 2:
+                args = (roads_gdf, time_table)
+            elif sprint_number == 3:
+                args = (roads_gdf, avg_speeds)
+            else:
+                # Sprint 4 reuses the travel-time-weighted graph sprint 3
+                # built instead of re-deriving it from the road table
+                args = (roads_gdf, avg_speeds, graph)
+
+            success, result = run_sprint(sprint_number, description, sprint_func, *args)
+            results.append((sprint_number, description, success))
+
+            if not success:
+                print(f"\n⚠ Sprint {sprint_number} failed. Stopping pipeline.")
+                break
+
+            if sprint_number == 2:
+                _, avg_speeds = result
+            elif sprint_number == 3:
+                _, graph = result
     
     # Final summary
     end_time = datetime.now()
@@ -85,19 +118,20 @@ def main():
         status = "✓ SUCCESS" if success else "✗ FAILED"
         print(f"  Sprint {sprint_number}: {description} - {status}")
     
+    total_sprints = 4
     successful_sprints = sum(1 for _, _, success in results if success)
-    print(f"\nOverall: {successful_sprints}/{len(sprints)} sprints completed successfully")
-    
-    if successful_sprints == len(sprints):
+    print(f"\nOverall: {successful_sprints}/{total_sprints} sprints completed successfully")
+
+    if successful_sprints == total_sprints:
         print("\n🎉 All sprints completed successfully!")
         print("Check the 'data/' directory for outputs:")
-        print("  - delhi_road_network_filtered.geojson")
-        print("  - delhi_simulated_traffic_data.csv")
+        print("  - delhi_road_network_filtered.parquet")
+        print("  - delhi_simulated_traffic_data.parquet")
         print("  - delhi_optimal_route.png")
         print("  - delhi_optimal_route.csv")
         print("  - delhi_pooled_routes.json")
     else:
-        print(f"\n⚠ Pipeline incomplete. {len(sprints) - successful_sprints} sprints failed.")
+        print(f"\n⚠ Pipeline incomplete. {total_sprints - successful_sprints} sprints failed.")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
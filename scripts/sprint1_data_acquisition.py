@@ -9,7 +9,12 @@ import pandas as pd
 import os
 
 def download_and_prepare_road_network():
-    """Download and prepare Delhi road network data"""
+    """Download and prepare Delhi road network data.
+
+    Returns the filtered edges GeoDataFrame so callers can hand it to the
+    next sprint in memory; the Parquet file is still written for
+    standalone runs.
+    """
     
     print("Starting Sprint 1: Data Acquisition & Preparation")
     print("=" * 50)
@@ -21,14 +26,25 @@ def download_and_prepare_road_network():
     # Download the road network for Delhi
     place_name = "Delhi, India"
     network_type = "drive"
-    
+    graphml_cache = 'data/delhi_raw.graphml'
+
+    # Cache Overpass responses so repeated runs skip the network round-trip
+    ox.settings.use_cache = True
+    ox.settings.cache_folder = 'data/osmnx_cache'
+
     try:
-        # Download the graph
-        G = ox.graph_from_place(place_name, network_type=network_type)
-        print(f"✓ Successfully downloaded road network for {place_name}")
+        if os.path.exists(graphml_cache):
+            # Reuse the parsed graph from a previous run
+            G = ox.load_graphml(graphml_cache)
+            print(f"✓ Loaded cached road network from {graphml_cache}")
+        else:
+            # Download the graph and cache it for subsequent runs
+            G = ox.graph_from_place(place_name, network_type=network_type)
+            ox.save_graphml(G, graphml_cache)
+            print(f"✓ Successfully downloaded road network for {place_name}")
         print(f"  - Nodes: {len(G.nodes())}")
         print(f"  - Edges: {len(G.edges())}")
-        
+
     except Exception as e:
         print(f"✗ Error downloading road network: {e}")
         return
@@ -52,13 +68,11 @@ def download_and_prepare_road_network():
         
         # Handle different highway column formats
         if 'highway' in edges_gdf.columns:
-            # Create a mask for filtering
-            mask = edges_gdf['highway'].apply(
-                lambda x: any(road_type in str(x).lower() if isinstance(x, str) else 
-                             any(road_type in str(item).lower() for item in x) if isinstance(x, list) else False
-                             for road_type in road_types)
-            )
-            
+            # Normalize list-valued entries (take first one), then match with a hashed isin
+            hw = edges_gdf['highway'].map(lambda x: x[0] if isinstance(x, list) else x)
+            hw = hw.astype('string').str.lower()
+            mask = hw.isin(road_types)
+
             filtered_edges = edges_gdf[mask].copy()
         else:
             print("⚠ Highway column not found, keeping all edges")
@@ -78,18 +92,34 @@ def download_and_prepare_road_network():
                                             col in ['name', 'maxspeed', 'lanes', 'oneway', 'surface']]
         
         filtered_edges = filtered_edges[useful_columns]
-        
+
+        # Simplified OSMnx graphs leave lists in tag columns (osmid,
+        # highway, name, ...) wherever ways were merged; pyarrow refuses
+        # object columns that mix scalars and lists, so keep the first
+        # element before the table is written or handed downstream
+        for col in filtered_edges.columns:
+            if col != 'geometry' and filtered_edges[col].dtype == object:
+                filtered_edges[col] = filtered_edges[col].map(
+                    lambda x: x[0] if isinstance(x, list) else x)
+
     except Exception as e:
         print(f"✗ Error filtering edges: {e}")
         return
     
     print("\n4. Saving filtered data...")
     try:
-        output_file = 'data/delhi_road_network_filtered.geojson'
-        filtered_edges.to_file(output_file, driver='GeoJSON')
+        output_file = 'data/delhi_road_network_filtered.parquet'
+        filtered_edges.to_parquet(output_file)
         print(f"✓ Successfully saved filtered road network to {output_file}")
         print(f"  - Final dataset: {len(filtered_edges)} road segments")
         print(f"  - File size: {os.path.getsize(output_file) / (1024*1024):.2f} MB")
+
+        # Save the filtered subgraph too, so sprint 3 can patch edge
+        # attributes onto it instead of rebuilding a graph from the table
+        filtered_graphml = 'data/delhi_filtered.graphml'
+        G_filtered = G.edge_subgraph(list(filtered_edges.index)).copy()
+        ox.save_graphml(G_filtered, filtered_graphml)
+        print(f"✓ Saved filtered graph to {filtered_graphml}")
         
         # Display sample of the data
         print(f"\n5. Sample of filtered data:")
@@ -103,5 +133,7 @@ def download_and_prepare_road_network():
     print("Sprint 1 completed successfully! ✓")
     print(f"Output: {output_file}")
 
+    return filtered_edges
+
 if __name__ == "__main__":
     download_and_prepare_road_network()
\ No newline at end of file
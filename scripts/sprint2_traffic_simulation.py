@@ -9,23 +9,81 @@ import numpy as np
 from datetime import datetime, timedelta
 import os
 
-def generate_traffic_simulation():
-    """Generate simulated traffic data with realistic patterns"""
-    
+try:
+    from joblib import Parallel, delayed
+except ImportError:
+    Parallel = None
+
+
+def simulate_speed_chunk(base_speed_chunk, factor, seed):
+    """Simulate clamped speeds for a chunk of roads across all time points"""
+    rng = np.random.default_rng(seed)
+    # Random noise (±5-10%) per road and hour, clamped to realistic speeds
+    noise = rng.uniform(0.9, 1.1, size=(len(base_speed_chunk), factor.size))
+    return np.clip(base_speed_chunk[:, None] * factor[None, :] * noise, 5, 80)
+
+
+def build_time_factor_table(start_date=datetime(2024, 1, 1),
+                            end_date=datetime(2024, 1, 7),
+                            time_interval=timedelta(hours=1)):
+    """Build the simulation time axis and its hour-of-week speed multipliers.
+
+    Independent of the road network, so the pipeline runner can compute
+    it while Sprint 1's network download is still in flight.
+    """
+    # Generate time points as a typed datetime64 index (no per-point Python objects)
+    time_points = pd.date_range(start=start_date, end=end_date, freq=time_interval, inclusive='left')
+
+    hour_arr = time_points.hour.to_numpy()
+    dow_arr = time_points.dayofweek.to_numpy()  # 0=Monday, 6=Sunday
+    weekday = dow_arr < 5
+
+    # Rush hour (8-10 AM and 5-7 PM on weekdays): reduce speed by 30-50%
+    rush = weekday & (((hour_arr >= 8) & (hour_arr <= 10)) | ((hour_arr >= 17) & (hour_arr <= 19)))
+    # Pre/post rush hour: reduce speed by 15-25%
+    shoulder = weekday & ~rush & (((hour_arr >= 6) & (hour_arr <= 8)) | ((hour_arr >= 19) & (hour_arr <= 21)))
+    # Night time: increase speed by 10-20%
+    weekday_night = weekday & ~rush & ~shoulder & ((hour_arr >= 22) | (hour_arr <= 5))
+    # Weekend afternoon: slight reduction
+    weekend_afternoon = ~weekday & (hour_arr >= 10) & (hour_arr <= 14)
+    # Weekend night: increase speed
+    weekend_night = ~weekday & ((hour_arr >= 22) | (hour_arr <= 6))
+
+    factor = np.ones(len(time_points))
+    factor[rush] = np.random.uniform(0.5, 0.7, size=rush.sum())
+    factor[shoulder] = np.random.uniform(0.75, 0.85, size=shoulder.sum())
+    factor[weekday_night] = np.random.uniform(1.1, 1.2, size=weekday_night.sum())
+    factor[weekend_afternoon] = np.random.uniform(0.85, 0.95, size=weekend_afternoon.sum())
+    factor[weekend_night] = np.random.uniform(1.15, 1.25, size=weekend_night.sum())
+
+    return time_points, factor
+
+def generate_traffic_simulation(roads_gdf=None, time_table=None):
+    """Generate simulated traffic data with realistic patterns.
+
+    Accepts the road network GeoDataFrame from Sprint 1 directly; when
+    run standalone it falls back to the Parquet file on disk. Returns
+    the traffic DataFrame plus the per-road average speeds that sprints
+    3/4 consume, so they can skip re-reducing the full time series.
+    """
+
     print("Starting Sprint 2: Simulated Traffic Data Generation")
     print("=" * 55)
-    
+
     print("1. Loading filtered road network data...")
     try:
-        input_file = 'data/delhi_road_network_filtered.geojson'
-        if not os.path.exists(input_file):
-            print(f"✗ Input file not found: {input_file}")
-            print("Please run Sprint 1 first to generate the road network data.")
-            return
-            
-        roads_gdf = gpd.read_file(input_file)
-        print(f"✓ Loaded {len(roads_gdf)} road segments")
-        
+        if roads_gdf is None:
+            input_file = 'data/delhi_road_network_filtered.parquet'
+            if not os.path.exists(input_file):
+                print(f"✗ Input file not found: {input_file}")
+                print("Please run Sprint 1 first to generate the road network data.")
+                return
+
+            roads_gdf = gpd.read_parquet(input_file)
+            print(f"✓ Loaded {len(roads_gdf)} road segments")
+        else:
+            print(f"✓ Using in-memory road network with {len(roads_gdf)} segments")
+
     except Exception as e:
         print(f"✗ Error loading data: {e}")
         return
@@ -53,104 +111,74 @@ def generate_traffic_simulation():
     print(f"✓ Base speeds configured for {len(base_speeds)} road types")
     
     print("\n3. Generating time series data...")
-    
-    traffic_data = []
-    current_time = start_date
-    time_points = []
-    
-    # Generate time points
-    while current_time < end_date:
-        time_points.append(current_time)
-        current_time += time_interval
-    
+
+    # Reuse a precomputed time/factor table (e.g. built while sprint 1's
+    # download was running) or build it now
+    if time_table is None:
+        time_table = build_time_factor_table(start_date, end_date, time_interval)
+    time_points, factor = time_table
+
     print(f"✓ Generated {len(time_points)} time points")
-    
+
     print("\n4. Simulating traffic speeds with realistic patterns...")
-    
-    total_records = len(roads_gdf) * len(time_points)
-    processed = 0
-    
-    for _, road in roads_gdf.iterrows():
-        osmid = road['osmid']
-        
-        # Determine base speed for this road type
-        highway_type = str(road.get('highway', 'default')).lower()
-        base_speed = base_speeds.get(highway_type, base_speeds['default'])
-        
-        # Handle list of highway types (take first one)
-        if '[' in highway_type:
-            highway_type = highway_type.replace('[', '').replace(']', '').replace("'", "").split(',')[0].strip()
-            base_speed = base_speeds.get(highway_type, base_speeds['default'])
-        
-        for timestamp in time_points:
-            # Apply time-based patterns
-            hour = timestamp.hour
-            day_of_week = timestamp.weekday()  # 0=Monday, 6=Sunday
-            
-            # Start with base speed
-            simulated_speed = base_speed
-            
-            # Apply rush hour effects (8-10 AM and 5-7 PM on weekdays)
-            if day_of_week < 5:  # Weekdays
-                if (8 <= hour <= 10) or (17 <= hour <= 19):
-                    # Rush hour: reduce speed by 30-50%
-                    reduction_factor = np.random.uniform(0.5, 0.7)
-                    simulated_speed *= reduction_factor
-                elif (6 <= hour <= 8) or (19 <= hour <= 21):
-                    # Pre/post rush hour: reduce speed by 15-25%
-                    reduction_factor = np.random.uniform(0.75, 0.85)
-                    simulated_speed *= reduction_factor
-                elif 22 <= hour or hour <= 5:
-                    # Night time: increase speed by 10-20%
-                    increase_factor = np.random.uniform(1.1, 1.2)
-                    simulated_speed *= increase_factor
-            else:  # Weekends
-                if 10 <= hour <= 14:
-                    # Weekend afternoon: slight reduction
-                    reduction_factor = np.random.uniform(0.85, 0.95)
-                    simulated_speed *= reduction_factor
-                elif 22 <= hour or hour <= 6:
-                    # Weekend night: increase speed
-                    increase_factor = np.random.uniform(1.15, 1.25)
-                    simulated_speed *= increase_factor
-            
-            # Add random noise (±5-10%)
-            noise_factor = np.random.uniform(0.9, 1.1)
-            simulated_speed *= noise_factor
-            
-            # Ensure speed is realistic (minimum 5 km/h, maximum 80 km/h)
-            simulated_speed = max(5, min(80, simulated_speed))
-            
-            traffic_data.append({
-                'osmid': osmid,
-                'timestamp': timestamp,
-                'simulated_speed_kph': round(simulated_speed, 2),
-                'highway_type': highway_type,
-                'base_speed': base_speed
-            })
-            
-            processed += 1
-            
-        # Progress indicator
-        if processed % 10000 == 0:
-            progress = (processed / total_records) * 100
-            print(f"  Progress: {progress:.1f}% ({processed:,} / {total_records:,} records)")
-    
-    print(f"✓ Generated {len(traffic_data)} traffic records")
-    
+
+    n_roads = len(roads_gdf)
+    n_hours = len(time_points)
+
+    # Determine base speed for each road type; list-valued highway tags
+    # (arrays after the Parquet round trip) take their first element
+    # before stringifying, instead of serializing and re-parsing brackets
+    highway_types = (roads_gdf['highway']
+                     .map(lambda x: x[0] if isinstance(x, (list, np.ndarray)) else x)
+                     .astype(str).str.lower())
+    base_speed_arr = highway_types.map(base_speeds).fillna(base_speeds['default']).to_numpy()
+
+    # osmid needs the same treatment: list-valued ids would poison the
+    # parquet writes below with a mixed scalar/list object column
+    osmid_arr = (roads_gdf['osmid']
+                 .map(lambda x: x[0] if isinstance(x, (list, np.ndarray)) else x)
+                 .to_numpy())
+
+    # Roads are independent, so the noise draw parallelizes across cores;
+    # each worker gets its own seeded generator for reproducibility
+    if Parallel is not None and n_roads > 1:
+        chunks = np.array_split(base_speed_arr, min(os.cpu_count() or 1, n_roads))
+        results = Parallel(n_jobs=-1)(
+            delayed(simulate_speed_chunk)(chunk, factor, 42 + i)
+            for i, chunk in enumerate(chunks)
+        )
+        speeds = np.vstack(results)
+    else:
+        speeds = simulate_speed_chunk(base_speed_arr, factor, 42)
+
+    print(f"✓ Generated {speeds.size:,} traffic records")
+
     print("\n5. Creating traffic DataFrame and adding analysis...")
-    
-    traffic_df = pd.DataFrame(traffic_data)
+
+    traffic_df = pd.DataFrame({
+        'osmid': np.repeat(osmid_arr, n_hours),
+        'timestamp': np.tile(time_points.to_numpy(), n_roads),
+        'simulated_speed_kph': speeds.ravel().round(2),
+        'highway_type': np.repeat(highway_types.to_numpy(), n_hours),
+        'base_speed': np.repeat(base_speed_arr, n_hours)
+    })
     
     # Add additional time-based features
     traffic_df['hour'] = traffic_df['timestamp'].dt.hour
     traffic_df['day_of_week'] = traffic_df['timestamp'].dt.dayofweek
     traffic_df['is_weekend'] = traffic_df['day_of_week'].isin([5, 6])
-    traffic_df['is_rush_hour'] = traffic_df.apply(
-        lambda row: (row['hour'] >= 8 and row['hour'] <= 10) or 
-                   (row['hour'] >= 17 and row['hour'] <= 19) and 
-                   not row['is_weekend'], axis=1
+    traffic_df['is_rush_hour'] = (~traffic_df['is_weekend']) & (
+        traffic_df['hour'].between(8, 10) | traffic_df['hour'].between(17, 19)
     )
+
+    # Downcast: float32/int8 carry all the precision these columns need
+    # and halve the bytes moved through the sprint3 groupby
+    traffic_df = traffic_df.astype({
+        'simulated_speed_kph': 'float32',
+        'base_speed': 'float32',
+        'hour': 'int8',
+        'day_of_week': 'int8'
+    })
     
     print(f"✓ Traffic DataFrame created with shape: {traffic_df.shape}")
     
@@ -164,13 +192,23 @@ def generate_traffic_simulation():
     
     print(f"\n7. Saving simulated traffic data...")
     try:
-        output_file = 'data/delhi_simulated_traffic_data.csv'
+        output_file = 'data/delhi_simulated_traffic_data.parquet'
         # Save only the required columns
         output_columns = ['osmid', 'timestamp', 'simulated_speed_kph']
-        traffic_df[output_columns].to_csv(output_file, index=False)
-        
+        traffic_df[output_columns].to_parquet(output_file, compression='zstd', engine='pyarrow')
+
         print(f"✓ Successfully saved traffic data to {output_file}")
         print(f"  - File size: {os.path.getsize(output_file) / (1024*1024):.2f} MB")
+
+        # Sprints 3/4 only consume the per-road mean, so emit it directly
+        # instead of making them re-reduce the full time series
+        avg_speeds = pd.DataFrame({
+            'osmid': osmid_arr,
+            'avg_speed_kph': speeds.mean(axis=1).astype('float32')
+        })
+        avg_file = 'data/delhi_roads_avg_speed.parquet'
+        avg_speeds.to_parquet(avg_file)
+        print(f"✓ Saved per-road average speeds to {avg_file}")
         
         # Display sample
         print(f"\n8. Sample of generated traffic data:")
@@ -184,5 +222,7 @@ def generate_traffic_simulation():
     print("Sprint 2 completed successfully! ✓")
     print(f"Output: {output_file}")
 
+    return traffic_df, avg_speeds
+
 if __name__ == "__main__":
     generate_traffic_simulation()
\ No newline at end of file
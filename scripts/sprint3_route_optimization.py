@@ -12,54 +12,107 @@ import numpy as np
 import os
 from datetime import datetime
 
-def optimize_single_route():
-    """Optimize a single route using traffic-aware travel times"""
-    
+try:
+    import igraph as ig
+except ImportError:
+    ig = None
+
+
+def find_shortest_path(G, orig, dest, weight='travel_time'):
+    """Find the shortest path, preferring igraph's C Dijkstra when available.
+
+    Falls back to ox.shortest_path (pure-Python Dijkstra) if igraph is
+    not installed. Returns the path as a list of OSMnx node ids, or
+    None if no path exists.
+    """
+    if ig is None:
+        return ox.shortest_path(G, orig, dest, weight=weight)
+
+    nodes = list(G.nodes())
+    node_to_idx = {node: i for i, node in enumerate(nodes)}
+    ig_graph = ig.Graph(
+        n=len(nodes),
+        edges=[(node_to_idx[u], node_to_idx[v]) for u, v in G.edges()],
+        directed=True
+    )
+    ig_graph.es['weight'] = [d[weight] for _, _, d in G.edges(data=True)]
+
+    path = ig_graph.get_shortest_paths(
+        node_to_idx[orig], node_to_idx[dest], weights='weight', output='vpath'
+    )[0]
+    if not path:
+        return None
+    return [nodes[i] for i in path]
+
+def optimize_single_route(roads_gdf=None, avg_speeds=None):
+    """Optimize a single route using traffic-aware travel times.
+
+    Accepts the road network and per-road average speeds from earlier
+    sprints in memory; when run standalone it loads the files they
+    wrote instead. Returns the route table together with the
+    travel-time-weighted graph so sprint 4 can reuse it directly.
+    """
+
     print("Starting Sprint 3: Core Route Optimization")
     print("=" * 45)
-    
+
     print("1. Loading road network and traffic data...")
     try:
         # Load road network
-        roads_file = 'data/delhi_road_network_filtered.geojson'
-        if not os.path.exists(roads_file):
-            print(f"✗ Road network file not found: {roads_file}")
-            return
-            
-        roads_gdf = gpd.read_file(roads_file)
-        print(f"✓ Loaded {len(roads_gdf)} road segments")
-        
-        # Load traffic data
-        traffic_file = 'data/delhi_simulated_traffic_data.csv'
-        if not os.path.exists(traffic_file):
-            print(f"✗ Traffic data file not found: {traffic_file}")
-            return
-            
-        traffic_df = pd.read_csv(traffic_file)
-        traffic_df['timestamp'] = pd.to_datetime(traffic_df['timestamp'])
-        print(f"✓ Loaded {len(traffic_df)} traffic records")
-        
+        if roads_gdf is None:
+            roads_file = 'data/delhi_road_network_filtered.parquet'
+            if not os.path.exists(roads_file):
+                print(f"✗ Road network file not found: {roads_file}")
+                return
+
+            # Only these columns feed the merge and the graph rebuild;
+            # projecting here keeps the reader from materializing the rest
+            roads_gdf = gpd.read_parquet(roads_file,
+                                         columns=['osmid', 'highway', 'length', 'geometry'])
+            print(f"✓ Loaded {len(roads_gdf)} road segments")
+        else:
+            print(f"✓ Using in-memory road network with {len(roads_gdf)} segments")
+
     except Exception as e:
         print(f"✗ Error loading data: {e}")
         return
-    
-    print("\n2. Calculating average traffic speeds...")
+
+    print("\n2. Loading average traffic speeds...")
     try:
-        # Calculate average speed for each road segment
-        avg_speeds = traffic_df.groupby('osmid')['simulated_speed_kph'].mean().reset_index()
-        avg_speeds.columns = ['osmid', 'avg_speed_kph']
-        
-        print(f"✓ Calculated average speeds for {len(avg_speeds)} road segments")
+        # Sprint 2 already reduced the time series to a per-road mean
+        if avg_speeds is None:
+            avg_file = 'data/delhi_roads_avg_speed.parquet'
+            if os.path.exists(avg_file):
+                avg_speeds = pd.read_parquet(avg_file)
+            else:
+                # Fall back to reducing the full traffic time series
+                traffic_file = 'data/delhi_simulated_traffic_data.parquet'
+                if not os.path.exists(traffic_file):
+                    print(f"✗ Traffic data file not found: {traffic_file}")
+                    return
+
+                traffic_df = pd.read_parquet(traffic_file, columns=['osmid', 'simulated_speed_kph'])
+                traffic_df = traffic_df.astype({'simulated_speed_kph': 'float32'})
+                avg_speeds = traffic_df.groupby('osmid')['simulated_speed_kph'].mean().reset_index()
+                avg_speeds.columns = ['osmid', 'avg_speed_kph']
+
+        print(f"✓ Average speeds available for {len(avg_speeds)} road segments")
         print(f"  - Overall average speed: {avg_speeds['avg_speed_kph'].mean():.2f} km/h")
-        
+
     except Exception as e:
-        print(f"✗ Error calculating average speeds: {e}")
+        print(f"✗ Error loading average speeds: {e}")
         return
     
     print("\n3. Merging traffic data with road network...")
     try:
-        # Merge average speeds with road network
-        roads_with_traffic = roads_gdf.merge(avg_speeds, on='osmid', how='left')
+        # avg_speeds rows are aligned with the road table (sprint 2 emits
+        # one row per segment, in order), so attach positionally and keep
+        # the (u, v, key) edge index intact; merge only as a fallback
+        if len(avg_speeds) == len(roads_gdf):
+            roads_with_traffic = roads_gdf.copy()
+            roads_with_traffic['avg_speed_kph'] = avg_speeds['avg_speed_kph'].to_numpy()
+        else:
+            roads_with_traffic = roads_gdf.merge(avg_speeds, on='osmid', how='left')
         
         # Fill missing speeds with default values based on road type
         default_speeds = {
@@ -67,16 +120,17 @@ def optimize_single_route():
             'primary_link': 40, 'secondary_link': 30, 'tertiary_link': 20
         }
         
-        def get_default_speed(highway):
-            highway_str = str(highway).lower()
-            for road_type, speed in default_speeds.items():
-                if road_type in highway_str:
-                    return speed
-            return 30  # default fallback
-        
         mask = roads_with_traffic['avg_speed_kph'].isna()
-        roads_with_traffic.loc[mask, 'avg_speed_kph'] = roads_with_traffic.loc[mask, 'highway'].apply(get_default_speed)
-        
+        road_type = (roads_with_traffic.loc[mask, 'highway'].astype(str).str.lower()
+                     .str.extract(r'(primary_link|secondary_link|tertiary_link|primary|secondary|tertiary)',
+                                  expand=False))
+        roads_with_traffic.loc[mask, 'avg_speed_kph'] = road_type.map(default_speeds).fillna(30)
+
+        # Travel time in minutes per edge, vectorized over the whole edge table
+        roads_with_traffic['travel_time'] = (
+            (roads_with_traffic['length'] / 1000) / roads_with_traffic['avg_speed_kph'] * 60
+        )
+
         print(f"✓ Merged traffic data with road network")
         print(f"  - Roads with traffic data: {len(roads_with_traffic) - mask.sum()}")
         print(f"  - Roads with default speeds: {mask.sum()}")
@@ -85,31 +139,31 @@ def optimize_single_route():
         print(f"✗ Error merging data: {e}")
         return
     
-    print("\n4. Rebuilding graph with travel times...")
+    print("\n4. Preparing graph with travel times...")
     try:
-        # Create a new graph from the merged data
-        G = ox.graph_from_gdfs(
-            gdf_nodes=None,  # Will be created automatically
-            gdf_edges=roads_with_traffic,
-            graph_attrs={'crs': roads_with_traffic.crs}
-        )
-        
-        print(f"✓ Rebuilt graph with {len(G.nodes())} nodes and {len(G.edges())} edges")
-        
-        # Calculate travel time for each edge
-        for u, v, key, data in G.edges(keys=True, data=True):
-            length_km = data.get('length', 1000) / 1000  # Convert to km
-            speed_kph = data.get('avg_speed_kph', 30)
-            travel_time_hours = length_km / speed_kph
-            travel_time_minutes = travel_time_hours * 60
-            
-            # Add travel time as edge attribute
-            G[u][v][key]['travel_time'] = travel_time_minutes
-        
-        print(f"✓ Added travel time attributes to all edges")
-        
+        filtered_graphml = 'data/delhi_filtered.graphml'
+        if os.path.exists(filtered_graphml) and isinstance(roads_with_traffic.index, pd.MultiIndex):
+            # Patch the cached graph's edge attributes in one pass instead
+            # of regenerating nodes and MultiDiGraph structure from scratch
+            G = ox.load_graphml(filtered_graphml)
+            edge_index = roads_with_traffic.index
+            nx.set_edge_attributes(
+                G, dict(zip(edge_index, roads_with_traffic['avg_speed_kph'])), 'avg_speed_kph')
+            nx.set_edge_attributes(
+                G, dict(zip(edge_index, roads_with_traffic['travel_time'])), 'travel_time')
+            print(f"✓ Patched cached graph with {len(G.nodes())} nodes and {len(G.edges())} edges")
+        else:
+            # Create a new graph from the merged data
+            G = ox.graph_from_gdfs(
+                gdf_nodes=None,  # Will be created automatically
+                gdf_edges=roads_with_traffic,
+                graph_attrs={'crs': roads_with_traffic.crs}
+            )
+            print(f"✓ Rebuilt graph with {len(G.nodes())} nodes and {len(G.edges())} edges")
+        print(f"✓ Travel time attributes carried over from the edge table")
+
     except Exception as e:
-        print(f"✗ Error rebuilding graph: {e}")
+        print(f"✗ Error preparing graph: {e}")
         return
     
     print("\n5. Finding optimal route...")
@@ -130,31 +184,18 @@ def optimize_single_route():
         
         # Find shortest path using travel time as weight
         try:
-            shortest_path = ox.shortest_path(G, start_node, end_node, weight='travel_time')
+            shortest_path = find_shortest_path(G, start_node, end_node, weight='travel_time')
+            if shortest_path is None:
+                print("✗ No path found between start and end points")
+                return
             print(f"✓ Found optimal route with {len(shortest_path)} nodes")
             
-            # Calculate route statistics
-            total_travel_time = 0
-            total_distance = 0
-            
-            for i in range(len(shortest_path) - 1):
-                u, v = shortest_path[i], shortest_path[i + 1]
-                # Handle multiple edges between nodes
-                edge_data = G[u][v]
-                if isinstance(edge_data, dict):
-                    if len(edge_data) == 1:
-                        key = list(edge_data.keys())[0]
-                        edge_info = edge_data[key]
-                    else:
-                        # Choose edge with minimum travel time
-                        key = min(edge_data.keys(), key=lambda k: edge_data[k].get('travel_time', float('inf')))
-                        edge_info = edge_data[key]
-                else:
-                    edge_info = edge_data
-                
-                total_travel_time += edge_info.get('travel_time', 0)
-                total_distance += edge_info.get('length', 0)
-            
+            # Calculate route statistics from the route's edge GeoDataFrame
+            # (route_to_gdf picks the minimum-weight edge between parallel edges)
+            route_gdf = ox.routing.route_to_gdf(G, shortest_path, weight='travel_time')
+            total_travel_time = route_gdf['travel_time'].sum()
+            total_distance = route_gdf['length'].sum()
+
             total_distance_km = total_distance / 1000
             avg_speed = total_distance_km / (total_travel_time / 60) if total_travel_time > 0 else 0
             
@@ -177,7 +218,11 @@ def optimize_single_route():
         
         # Plot the graph
         ox.plot_graph(G, ax=ax, node_size=0, edge_color='lightgray', edge_linewidth=0.5, show=False, close=False)
-        
+
+        # Rasterize the dense background edge layer; the route below stays vector
+        for collection in ax.collections:
+            collection.set_rasterized(True)
+
         # Plot the route
         ox.plot_graph_route(G, shortest_path, ax=ax, route_color='red', route_linewidth=3, 
                            orig_dest_size=100, show=False, close=False)
@@ -190,7 +235,7 @@ def optimize_single_route():
         
         # Save the visualization
         output_image = 'data/delhi_optimal_route.png'
-        plt.savefig(output_image, dpi=300, bbox_inches='tight')
+        plt.savefig(output_image, dpi=150, bbox_inches='tight')
         print(f"✓ Route visualization saved to {output_image}")
         
         plt.close()
@@ -201,18 +246,16 @@ def optimize_single_route():
     
     print("\n7. Saving route data...")
     try:
-        # Create route dataframe
-        route_data = []
-        for i, node in enumerate(shortest_path):
-            node_data = G.nodes[node]
-            route_data.append({
-                'sequence': i,
-                'node_id': node,
-                'latitude': node_data['y'],
-                'longitude': node_data['x']
-            })
-        
-        route_df = pd.DataFrame(route_data)
+        # Create route dataframe, one typed array per column
+        n_waypoints = len(shortest_path)
+        xs = np.fromiter((G.nodes[n]['x'] for n in shortest_path), dtype=np.float64, count=n_waypoints)
+        ys = np.fromiter((G.nodes[n]['y'] for n in shortest_path), dtype=np.float64, count=n_waypoints)
+        route_df = pd.DataFrame({
+            'sequence': np.arange(n_waypoints),
+            'node_id': shortest_path,
+            'latitude': ys,
+            'longitude': xs
+        })
         output_csv = 'data/delhi_optimal_route.csv'
         route_df.to_csv(output_csv, index=False)
         
@@ -233,5 +276,7 @@ def optimize_single_route():
     print(f"  - Route visualization: data/delhi_optimal_route.png")
     print(f"  - Route coordinates: data/delhi_optimal_route.csv")
 
+    return route_df, G
+
 if __name__ == "__main__":
     optimize_single_route()
\ No newline at end of file